@@ -3,6 +3,10 @@ import re
 import asyncio
 import logging
 import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import Popen, PIPE
 
 from .toolbox.utils import which
@@ -10,6 +14,34 @@ from .toolbox import tostr, tobytes
 
 log = logging.getLogger('stagehand.web.coffee')
 
+# Inline CoffeeScript blocks within HTML
+_CS_SCRIPT_RE = re.compile(r'''<script\s+type\s*=\s*['"]text/coffeescript['"]([^>]*)>(.*?)</script>''', re.S | re.I)
+# The whole file, for non-HTML sources
+_CS_IDENTITY_RE = re.compile('^()(.*)$', re.S)
+# <script type='text/coffescript' src='foo.coffee'>
+_CS_TYPE_FIX_RE = re.compile(r'(<script[^>]*)text/coffeescript')
+# Line number information in compiler errors
+_CS_ONLINE_STRIP_RE = re.compile(r'\s+on line \d+')
+_CS_ONLINE_FIND_RE = re.compile(r'on line (\d+)')
+
+# In-memory cache for cscompile_with_cache(): (src, is_html) -> (mtime, data),
+# least recently used first.
+_CS_MEMO = OrderedDict()
+_CS_MEMO_SIZE = 256
+# cscompile_with_cache() may be called from executor threads.
+_CS_MEMO_LOCK = threading.Lock()
+
+
+def _cachename(src):
+    """
+    Returns the filename in the cache directory for the given source file.
+    """
+    path = tobytes(src, fs=True)
+    if hasattr(hashlib, 'blake2b'):
+        # Python 3.6+
+        return hashlib.blake2b(path, digest_size=16).hexdigest()
+    return hashlib.md5(path).hexdigest()
+
 class CSCompileError(ValueError):
     pass
 
@@ -27,12 +59,9 @@ def cscompile(src, dst=None, is_html=None):
     if is_html is None:
         # Try to detect (lamely) if src is HTML
         is_html = data[0:100].lstrip()[0] == '<'
-    if is_html:
-        cre = re.compile(r'''<script\s+type\s*=\s*['"]text/coffeescript['"]([^>]*)>(.*?)</script>''', re.S | re.I)
-    else:
-        cre = re.compile('^()(.*)$', re.S)
+    cre = _CS_SCRIPT_RE if is_html else _CS_IDENTITY_RE
 
-    def subfunc(match):
+    def compile_block(match):
         # TODO: readd indentation
         attrs, script = match.groups()
         if not script.strip():
@@ -40,12 +69,11 @@ def cscompile(src, dst=None, is_html=None):
 
         proc = Popen(csargs, stdin=PIPE, stdout=PIPE, stderr=PIPE)
         stdout, stderr = proc.communicate(tobytes(script))
-        if stderr:
+        if proc.returncode != 0:
             # Compile failed. Figure out what line caused the error.
             stderr = tostr(stderr)
-            errmsg = stderr.lstrip().splitlines()[0]
-            error = re.sub(r'\s+on line \d+', '', stderr.lstrip().splitlines()[0])
-            linematch = re.search('on line (\d+)', stderr)
+            error = _CS_ONLINE_STRIP_RE.sub('', (stderr.lstrip().splitlines() or [''])[0])
+            linematch = _CS_ONLINE_FIND_RE.search(stderr)
             if linematch:
                 # This is the line relative to the coffescript portion
                 linenum = int(linematch.group(1))
@@ -59,29 +87,97 @@ def cscompile(src, dst=None, is_html=None):
             else:
                 dump = 'Unable to determine line number.  Full coffee output follows:\n\n' + stderr
             raise CSCompileError('CoffeeScript ' + error, dump)
+        elif stderr:
+            # Compiled fine, but had something to say about it (deprecation
+            # warnings and the like).
+            log.debug('coffee warning for %s: %s', src, tostr(stderr).strip())
 
         if is_html:
             return "<script type='text/javascript'%s>\n%s</script>" % (attrs, tostr(stdout))
         else:
             return tostr(stdout)
 
+    matches = list(cre.finditer(data))
+    if len(matches) > 1:
+        # Each block is compiled by a separate coffee process, so compile them
+        # in parallel rather than paying node's startup cost once per block in
+        # turn.  The workers just block on pipes.
+        with ThreadPoolExecutor(max_workers=min(len(matches), 4)) as pool:
+            results = list(pool.map(compile_block, matches))
+    else:
+        results = [compile_block(match) for match in matches]
+
+    # Splice the compiled blocks back into the source.
+    parts = []
+    last = 0
+    for match, result in zip(matches, results):
+        parts.extend((data[last:match.start()], result))
+        last = match.end()
+    parts.append(data[last:])
+
     comment = 'This is a generated file. Edits will be lost.'
-    data = cre.sub(subfunc, data)
+    data = ''.join(parts)
     # Handle <script type='text/coffescript' src='foo.coffee'>
-    data = re.sub(r'(<script[^>]*)text/coffeescript', '\\1text/javascript', data)
+    data = _CS_TYPE_FIX_RE.sub('\\1text/javascript', data)
     if not is_html:
         data = '// %s\n' % comment + data
     #data = ('<!-- %s -->\n' if is_html else '// %s\n') % comment + data
     if dst:
-        with open(dst, 'w') as f:
-            f.write(data)
+        # Write to a temporary file and move it into place, so that a
+        # concurrent (or later, after a crash) reader never sees a partially
+        # written file that appears newer than the source.  Compiles can run
+        # concurrently in executor threads, so each writer gets its own
+        # temporary file.
+        f = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(dst), delete=False)
+        try:
+            with f:
+                f.write(data)
+            os.replace(f.name, dst)
+        except:
+            os.unlink(f.name)
+            raise
     return data
 
 
+def cscompile_from_memo(src, is_html=None):
+    """
+    Returns the compiled data for src if cscompile_with_cache() has already
+    loaded or compiled it since it was last modified, or None otherwise.
+
+    This doesn't touch the cache directory, so it's cheap enough to call from
+    the main loop before deciding whether to call cscompile_with_cache() from
+    an executor.
+    """
+    key = src, is_html
+    mtime = os.path.getmtime(src)
+    with _CS_MEMO_LOCK:
+        memo = _CS_MEMO.get(key)
+        if memo and memo[0] == mtime:
+            _CS_MEMO.move_to_end(key)
+            return memo[1]
+
+
 def cscompile_with_cache(src, cachedir, is_html=None):
-    log = logging.getLogger('stagehand.web.coffee')
+    # If we've already loaded or compiled this source since it was last
+    # modified, skip the filesystem entirely.
+    data = cscompile_from_memo(src, is_html)
+    if data is not None:
+        return True, data
+
+    mtime = os.path.getmtime(src)
+    cached, data = _cscompile_with_cache(src, cachedir, is_html)
+    with _CS_MEMO_LOCK:
+        key = src, is_html
+        _CS_MEMO[key] = mtime, data
+        _CS_MEMO.move_to_end(key)
+        if len(_CS_MEMO) > _CS_MEMO_SIZE:
+            _CS_MEMO.popitem(last=False)
+    return cached, data
+
+
+def _cscompile_with_cache(src, cachedir, is_html):
     compiled = src + '.compiled'
-    cached = os.path.join(cachedir, hashlib.md5(tobytes(src, fs=True)).hexdigest())
+    cached = os.path.join(cachedir, _cachename(src))
 
     if os.path.isfile(compiled) and os.path.getmtime(src) <= os.path.getmtime(compiled):
         #log.debug2('Using system compiled %s', compiled)
@@ -97,16 +97,31 @@ def create_paths(paths):
     os.makedirs(os.path.dirname(paths.config), exist_ok=True)
 
 
+# (st_mtime_ns, st_size) of the config file as of the last SIGHUP reload.
+_last_cfg_stat = None
+
 def reload(mgr):
+    global _last_cfg_stat
     log.warning('received SIGHUP: purging in-memory caches and reloading config')
-    config.load()
+    try:
+        st = os.stat(config.filename)
+        cfg_stat = st.st_mtime_ns, st.st_size
+    except OSError:
+        cfg_stat = None
+    if cfg_stat is None or cfg_stat != _last_cfg_stat:
+        config.load()
+        _last_cfg_stat = cfg_stat
+    else:
+        log.info('config file unchanged, not reloading it')
     mgr.tvdb.purge_caches()
-    loop.call_soon(asyncio.async, mgr.check_new_episodes())
+    # Signal handlers added with add_signal_handler() already run from the
+    # event loop, so the task can be scheduled directly.
+    asyncio.async(mgr.check_new_episodes(), loop=mgr.loop)
 
 
 def resync(mgr):
     log.warning('received SIGUSR1: refreshing thetvdb')
-    loop.call_soon(asyncio.async, mgr.tvdb.sync())
+    asyncio.async(mgr.tvdb.sync(), loop=mgr.loop)
 
 
 @asyncio.coroutine
@@ -131,12 +146,10 @@ def web_start_server(mgr, args):
         try:
             yield from web.start(port=port, log=logging.getLogger('stagehand.http'), userdata=userdata, **webkwargs)
         except OSError as e:
-            if e.errno in (errno.EACCES, errno.EADDRINUSE):
-                log.error('could not start webserver on port %d: %s', port, str(e))
-            elif e.errno == errno.EADDRNOTAVAIL:
-                log.error('could not start webserver on interface %s: %s', config.web.bind_address, str(e))
+            # The web server has already logged the error.
+            if e.errno == errno.EADDRNOTAVAIL:
                 break
-            else:
+            elif e.errno not in (errno.EACCES, errno.EADDRINUSE):
                 raise
         else:
             # Server started successfully.  Store current port for service control.
@@ -219,12 +232,15 @@ def main():
 
     create_paths(paths)
 
-    handler = logging.FileHandler(os.path.join(paths.logs, 'stagehand.log'))
-    handler.setFormatter(logging.getLogger().handlers[0].formatter)
+    # Log files are only opened once something is logged to them, so e.g.
+    # --stop doesn't touch http.log.
+    formatter = logging.getLogger().handlers[0].formatter
+    handler = logging.FileHandler(os.path.join(paths.logs, 'stagehand.log'), delay=True)
+    handler.setFormatter(formatter)
     logging.getLogger().addHandler(handler)
 
-    handler = logging.FileHandler(os.path.join(paths.logs, 'http.log'))
-    handler.setFormatter(logging.getLogger().handlers[0].formatter)
+    handler = logging.FileHandler(os.path.join(paths.logs, 'http.log'), delay=True)
+    handler.setFormatter(formatter)
     logging.getLogger('stagehand.http').addHandler(handler)
 
     if args.stop:
@@ -271,6 +287,18 @@ def main():
         daemonize(chdir=None)
 
     log.info('starting Stagehand %s', __version__)
+    # Use uvloop's faster event loop if it's available.  This is done after
+    # daemonizing, so the loop we run on isn't created before the fork (the
+    # policy's first get_event_loop() creates a new one).  Anything created
+    # before this point, like asyncweb at import time, must not hold on to
+    # the loop it saw then.
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        log.debug('using uvloop event loop')
     loop = asyncio.get_event_loop()
     mgr = Manager(paths, loop=loop)
     # Take care to start platform plugins before any logging is done.  At least
@@ -268,6 +268,16 @@ class Manager:
         return False
 
 
+    def get_queued_episode_set(self):
+        """
+        Returns a frozenset of all episodes currently queued for retrieval.
+
+        When checking many episodes, this is cheaper than calling
+        :meth:`is_episode_queued_for_retrieval` for each one.
+        """
+        return frozenset(qep for qep, qresults in self.retrieve_queue)
+
+
     def cancel_episode_retrieval(self, ep):
         # If the episode is in the pending queue, remove it.
         for qep, results in self._retrieve_queue[:]:
@@ -1221,6 +1221,25 @@ class Database:
         return self._delete_multiple_objects({object_type: (object_id,)})
 
 
+    def delete_many(self, objs):
+        """
+        Delete multiple objects at once.
+
+        :param objs: the objects to delete
+        :type objs: list of :class:`ObjectRow` or (object_type, object_id)
+        :returns: the number of objects deleted
+        :rtype: int
+
+        This is equivalent to calling :meth:`~Database.delete` for each object,
+        but issues one DELETE statement per object type.
+        """
+        objects = {}
+        for obj in objs:
+            object_type, object_id = self._to_obj_tuple(obj)
+            objects.setdefault(object_type, []).append(object_id)
+        return self._delete_multiple_objects(objects)
+
+
     def reparent(self, obj, parent):
         """
         Change the parent of an object.
@@ -33,16 +33,40 @@ import aiohttp
 
 log = logging.getLogger('http')
 
+# Connector shared by all downloads, so that keep-alive connections to the
+# same host (e.g. successive provider API calls) can be reused rather than
+# each request setting up its own connection.
+_connector = None
+
+def _get_connector():
+    global _connector
+    if _connector is None:
+        _connector = aiohttp.TCPConnector()
+    return _connector
+
 @asyncio.coroutine
 def _download(url, target=None, resume=True, progress=None, **kwargs):
     if not target:
-        target = io.BytesIO()
-    elif not hasattr(target, 'write'):
-        target = open(target, 'ab+' if resume else 'wb')
+        # Download into memory.  Chunks are collected and joined once at the
+        # end, rather than repeatedly growing a buffer as data arrives.
+        chunks = []
+        write = chunks.append
+    else:
+        chunks = None
+        if not hasattr(target, 'write'):
+            target = open(target, 'ab+' if resume else 'wb')
+        write = target.write
 
+    response = None
+    # Set once the body has been fully read, at which point the connection
+    # can go back to the connector for reuse.
+    complete = False
     try:
         headers = kwargs.setdefault('headers', {})
-        if resume:
+        if chunks is not None:
+            # Nothing to resume from.
+            expected_pos = 0
+        elif resume:
             pos = target.seek(0, io.SEEK_END)
             if pos > 0:
                 headers['Range'] = 'bytes={}-'.format(pos)
@@ -54,6 +78,7 @@ def _download(url, target=None, resume=True, progress=None, **kwargs):
 
         log.info('fetching %s', url)
         method = kwargs.pop('method', 'GET')
+        kwargs.setdefault('connector', _get_connector())
         response = yield from aiohttp.request(method, url, **kwargs)
         if response.status >= 300:
             raise aiohttp.HttpErrorException(response.status)
@@ -91,14 +116,19 @@ def _download(url, target=None, resume=True, progress=None, **kwargs):
                     progress.update(diff=len(chunk))
             except aiohttp.EofStream:
                 break
-            target.write(chunk)
+            write(chunk)
 
-        if isinstance(target, io.BytesIO):
-            return response.status, target.getvalue()
+        complete = True
+        if chunks is not None:
+            return response.status, b''.join(chunks)
         else:
             return response.status, response
     finally:
-        if not isinstance(target, io.BytesIO):
+        if response is not None:
+            # On error the connection is in an unknown state (possibly with
+            # unread body), so don't let it be reused.
+            response.close(force=not complete)
+        if chunks is None:
             target.close()
 
 
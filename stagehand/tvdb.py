@@ -6,6 +6,7 @@ import logging
 import re
 import itertools
 import difflib
+from collections import defaultdict
 from datetime import datetime, timedelta
 import asyncio
 
@@ -16,9 +17,67 @@ from .config import config
 from .searchers import SearchResult
 from .providers import plugins, ProviderError
 
+# rapidfuzz is optional, but considerably faster than difflib for fuzzy name
+# matching.
+try:
+    from rapidfuzz import fuzz, process as fuzzprocess, utils as fuzzutils
+except ImportError:
+    fuzz = fuzzprocess = fuzzutils = None
+# rapidfuzz's bulk scoring (process.cdist()) returns a numpy array, so
+# _closest_names() also needs numpy, which rapidfuzz doesn't depend on.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # get logging object
 log = logging.getLogger('stagehand.tvdb')
 
+# Matches aggressively normalized names of unnamed episodes, e.g. "TBA" or
+# "Season 1, Episode 1"
+_UNNAMED_RE = re.compile(r'tba$|season\d+episode\d+')
+# Used by TVDB._normalize_name()
+_BRACKETS_RE = re.compile(r'\([^)]+\)')
+_WITH_NAME_RE = re.compile(r'with +\w+ +\w+\b')
+_NONWORD_RE = re.compile(r'\W')
+
+
+def _closest_names(queries, choices, cutoff):
+    """
+    Fuzzy matches normalized episode names against those of other providers.
+
+    :param queries: list of (provider, normalized name, epdict) to match
+    :param choices: list of (provider, normalized name, epdict) to match against
+    :param cutoff: minimum similarity (between 0 and 1) to be considered a match
+    :returns: a list parallel to queries holding the closest matching name
+              from a different provider, or None if nothing was close enough.
+    """
+    if fuzz and numpy:
+        # Score all queries against all choices in a single call rather than
+        # once per query.  Scores below the cutoff are 0.
+        scores = fuzzprocess.cdist([nn for p, nn, ep in queries], [nn for p, nn, ep in choices],
+                                   scorer=fuzz.ratio, score_cutoff=cutoff * 100)
+        closest = []
+        for (provider, nn, ep), row in zip(queries, scores.tolist()):
+            # Like difflib.get_close_matches(), ties go to the larger name.
+            matched = [(score, xnn) for (xprv, xnn, xep), score in zip(choices, row) if score and xprv != provider]
+            closest.append(max(matched)[1] if matched else None)
+        return closest
+
+    # Group names by provider, and from that build the list of names from all
+    # _other_ providers once per provider.
+    by_provider = {}
+    for xprv, xnn, xep in choices:
+        by_provider.setdefault(xprv, []).append(xnn)
+    others = {}
+    for xprv in by_provider:
+        others[xprv] = list(itertools.chain.from_iterable(v for k, v in by_provider.items() if k != xprv))
+    closest = []
+    for provider, nn, ep in queries:
+        matched = difflib.get_close_matches(nn, others.get(provider, ()), 1, cutoff)
+        closest.append(matched[0] if matched else None)
+    return closest
+
 # XXX: testing python based ObjectRow
 #db.ObjectRow = db.PyObjectRow
 
@@ -391,6 +450,9 @@ class Series:
         self._cfg = None
         self._season_cache = []
         self._season_cache_ver = None
+        # ids, and the dbrow they were computed from
+        self._ids = None
+        self._ids_dbrow = None
 
     def __repr__(self):
         return '<%s %s at 0x%x>' % (self.__class__.__name__, self.name, id(self))
@@ -487,7 +549,13 @@ class Series:
         """
         All provider ids for this series.
         """
-        return ['%s:%s' % (p.NAME, self._dbattr(p.IDATTR)) for p in self.providers]
+        # Refreshes the dbrow if it's stale.  The ids only change when the
+        # dbrow does, so recompute them only then.
+        self._dbattr('id')
+        if self._ids_dbrow is not self._dbrow:
+            self._ids = tuple(sys.intern('%s:%s' % (p.NAME, self._dbattr(p.IDATTR))) for p in self.providers)
+            self._ids_dbrow = self._dbrow
+        return self._ids
 
     @property
     def conflict(self):
@@ -647,12 +715,19 @@ class TVDB(db.Database):
         }, loop=loop)
         self._version = 0
         self._series_cache = {}
+        # Same as _series_cache, but as provider name -> {pid -> Series}
+        self._series_cache_by_provider = {}
         self._series_cache_list = []
         self._series_cache_ver = None
         # A list of series ids to ignore in the database.
         self._series_ignore = []
         # Tracks active _do_update_series tasks by series id
         self._update_tasks_by_id = {}
+        # Maps normalized series ids to (position, cfg) for config.series,
+        # built lazily by _get_series_cfg_index()
+        self._series_cfg_index = None
+        self._series_cfg_index_len = None
+        config.series.add_monitor(self._invalidate_series_cfg_index)
 
         if self.readonly:
             log.warning('upgrading database to support new version of Stagehand')
@@ -718,6 +793,7 @@ class TVDB(db.Database):
         if self._series_cache_ver == self._version:
             return
         cache = {}
+        by_provider = {}
         for data in self.query(type='series'):
             # Is this already in the series cache?
             series = self._series_cache.get(data['id']) if self._series_cache else None
@@ -732,8 +808,11 @@ class TVDB(db.Database):
                 # known ids to the series cache.
                 for id in series.ids:
                     cache[id] = series
+                    name, pid = id.split(':', 1)
+                    by_provider.setdefault(name, {})[pid] = series
 
         self._series_cache = cache
+        self._series_cache_by_provider = by_provider
         self._series_cache_ver = self._version
         self._series_cache_list = list(set(cache.values()))
 
@@ -808,16 +887,17 @@ class TVDB(db.Database):
         stopwords = 'the', 'a'
         if aggressive:
             # Remove anything in brackets.
-            name = re.sub(r'\([^)]+\)', '', name)
+            name = _BRACKETS_RE.sub('', name)
             # Some shows have a "with Firstname Lastname" suffix, like "The Daily Show
             # with Jon Stewart".  Strip this out.
             # FIXME: hardcoded English
-            name = re.sub(r'with +\w+ +\w+\b', '', name)
+            name = _WITH_NAME_RE.sub('', name)
 
         # Replace & with 'and' and remove other non-word characters
-        name = re.sub(r'\W', ' ', name.replace('&', 'and').replace('.', '').lower())
-        # Remove stop words and remove whitespace.
-        return remove_stop_words(name).replace(' ', '')
+        name = _NONWORD_RE.sub(' ', name.replace('&', 'and').replace('.', '').lower())
+        # Remove stop words and remove whitespace.  Normalized names are compared
+        # and hashed heavily by _get_conflicts(), so intern them.
+        return sys.intern(remove_stop_words(name).replace(' ', ''))
 
 
     def _get_conflicts(self, pseries):
@@ -850,25 +930,35 @@ class TVDB(db.Database):
         # This is probably solvable with fewer and/or simpler steps, but for now this
         # seems to work well on real world data.
 
-        conflicts = {} # (name, airdate) -> [(provider, epdict), ...]
-        matches = {}   # (name, airdate) -> [(provider, epdict), ...]
-        unmatched = [] # [(provider, normalized name, epdict), ...]
-        names = {}     # normalized name -> [(provider, epdict), ...]
-        dates = {}     # air date -> [(provider, normalized name, epdict), ...]
+        conflicts = defaultdict(list) # (name, airdate) -> [(provider, epdict), ...]
+        matches = defaultdict(list)   # (name, airdate) -> [(provider, epdict), ...]
+        unmatched = []                # [(provider, normalized name, epdict), ...]
+        names = {}                    # normalized name -> {provider: [epdict, ...]}
+        dates = defaultdict(list)     # air date -> [(provider, normalized name, epdict), ...]
+        aggressive = {}               # id(epdict) -> (aggressively normalized name, is unnamed)
+        years = {}                    # id(epdict) -> air date year (or None)
+        placed = set()                # {id(epdict), ...} already matched or conflicted by step 2
 
         # Step 1: map all episodes by normalized name (names dict) and air dates (dates dict)
         for provider, series in pseries.items():
             for ep in series['episodes']:
                 if ep['name']:
                     nn = self._normalize_name(ep['name'])
-                    names.setdefault(nn, []).append((provider, ep))
-                    dates.setdefault(ep['airdate'], []).append((provider, nn, ep))
+                    names.setdefault(nn, {}).setdefault(provider, []).append(ep)
+                    dates[ep['airdate']].append((provider, nn, ep))
+                    # Used by steps 4 and 6.  These are kept in parallel dicts
+                    # rather than annotated directly on the episode dicts because
+                    # they end up cached in the database.
+                    years[id(ep)] = sys.intern(ep['airdate'][:4]) if ep['airdate'] else None
+                    nn_aggr = self._normalize_name(ep['name'], aggressive=True)
+                    aggressive[id(ep)] = nn_aggr, _UNNAMED_RE.match(nn_aggr) is not None
 
         # Step 2: handle the case where the episodes with the same name and
         # episode code have different air dates.  We want to handle that now
         # because the search by air date later could categorize one of the
         # episodes in unmatched, and others in conflicts.
-        for nn, episodes in names.items():
+        for nn, by_provider in names.items():
+            episodes = [(provider, ep) for provider, eps in by_provider.items() for ep in eps]
             codes = set((ep['season'], ep['episode']) for provider, ep in episodes)
             airdates = set(ep['airdate'] for provider, ep in episodes)
             if len(codes) == 1:
@@ -876,141 +966,167 @@ class TVDB(db.Database):
                     # This isn't a real conflict: there is only one actual air date
                     # but one or more episodes have no air date yet.  Episode codes
                     # agree, so let's add this to matches.
-                    matches.setdefault((nn, None), []).extend(episodes)
+                    matches[(nn, None)].extend(episodes)
+                    placed.update(id(ep) for provider, ep in episodes)
                 elif len(airdates) > 1:
                     # All episodes for this name agree on epcode but not on air
                     # date: move to conflict dict with airdate=None.
-                    conflicts.setdefault((nn, None), []).extend(episodes)
+                    conflicts[(nn, None)].extend(episodes)
+                    placed.update(id(ep) for provider, ep in episodes)
 
         # Step 3: remaining episodes with the same air date are matched if their
         # names match fuzzily, and to conflicts if they don't.  Episodes on a given
         # air date without episodes from other providers on that date are moved to
         # unmatched.
         for airdate, eps in dates.items():
-            for provider, nn, ep in eps:
-                if (provider, ep) in conflicts.get((nn, None), ()) or (provider, ep) in matches.get((nn, None), ()):
-                    # This episode is already in the conflict (or match) list due to
-                    # different air date.
-                    continue
-                # List of normalized names for all other episodes in other providers
-                nnames = [xnn for xprv, xnn, xep in eps if xprv != provider and ep != xep]
-                if not nnames:
-                    # Well, there _are_ no other episodes from other providers, so this is unmatched.
-                    unmatched.append((provider, nn, ep))
-                    continue
+            # Episodes already in the conflict (or match) list due to different
+            # air date are skipped.
+            pending = [(provider, nn, ep) for provider, nn, ep in eps if id(ep) not in placed]
+            if len(set(provider for provider, nn, ep in eps)) == 1:
+                # Well, there _are_ no other episodes from other providers, so these are unmatched.
+                unmatched.extend(pending)
+                continue
 
-                matched_nn = difflib.get_close_matches(nn, nnames, 10, 0.8)
-                if matched_nn:
+            # Fuzzy match all pending names on this air date against episodes from
+            # other providers in one go.
+            for (provider, nn, ep), matched_nn in zip(pending, _closest_names(pending, eps, 0.8)):
+                if matched_nn is not None:
                     # Fuzzy name match for an episode from another provider on
                     # the same air date.  Since it's a fuzzy match, the matched
                     # name could be different than the current normalized name.
                     # We need to group these together, so always pick the
                     # lowest ordered (lexically) nn.
-                    nn = min(matched_nn[0], nn)
-                    matches.setdefault((nn, ep['airdate']), []).append((provider, ep))
+                    if matched_nn < nn:
+                        nn = matched_nn
+                    matches[(nn, ep['airdate'])].append((provider, ep))
                 else:
                     # There are episodes from other providers with this air date,
                     # but none match this name.  So add this to the conflict list.
-                    conflicts.setdefault((None, ep['airdate']), []).append((provider, ep))
+                    conflicts[(None, ep['airdate'])].append((provider, ep))
 
 
         # Step 4: try to match any unmatched episodes (due to different air dates) by name.
-        for a_provider, nn, a_ep in unmatched[:]:
-            for b_provider, b_ep in names[nn]:
+        # Matched episodes are flagged here and dropped from unmatched in one pass
+        # afterward, rather than removed from the list one at a time.
+        matched = bytearray(len(unmatched))
+        for idx, (a_provider, nn, a_ep) in enumerate(unmatched):
+            a_year = years[id(a_ep)]
+            for b_provider, b_eps in names[nn].items():
                 if a_provider == b_provider:
-                    # Another episode from the same provider, not relevant.
+                    # Episodes from the same provider, not relevant.
                     continue
-                # TODO: fuzzy date match (date differences are within say 6 days)
-                a_air, b_air = a_ep['airdate'], b_ep['airdate']
-                if not a_air or not b_air or a_air[:4] == b_air[:4]:
-                    # One (or both) of the episodes have no air date, so we permit
-                    # this match by name.  Or, the year is the same.
-                    unmatched.remove((a_provider, nn, a_ep))
-                    date = a_air[:4] if a_air else (a_air or b_air)
-                    matches.setdefault((nn, date), []).append((a_provider, a_ep))
-                    # Managed to match it, so stop looping over names[nn] list.
+                for b_ep in b_eps:
+                    # TODO: fuzzy date match (date differences are within say 6 days)
+                    b_year = years[id(b_ep)]
+                    if not a_year or not b_year or a_year == b_year:
+                        # One (or both) of the episodes have no air date, so we permit
+                        # this match by name.  Or, the year is the same.
+                        matched[idx] = 1
+                        date = a_year or b_ep['airdate']
+                        matches[(nn, date)].append((a_provider, a_ep))
+                        break
+                if matched[idx]:
+                    # Managed to match it, so stop looping over names[nn].
                     break
+        unmatched = [item for item, m in zip(unmatched, matched) if not m]
 
 
         # Step 5: now go through matches (which up to this point match on air date and
         # name), check season/episode numbers, and move to conflicts any
-        # disagreements.
-        for (nn, airdate), episodes in list(matches.items()):
-            codes = set((ep['season'], ep['episode']) for provider, ep in episodes)
-            if len(codes) > 1:
+        # disagreements.  Keys are collected and moved after the loop so that
+        # matches isn't mutated while we're iterating over it.
+        disagree = []
+        for key, episodes in matches.items():
+            # Stop at the first episode whose code differs from the first one.
+            first = episodes[0][1]
+            code = first['season'], first['episode']
+            if any((ep['season'], ep['episode']) != code for provider, ep in episodes):
                 # Kludge alert: some series on TheTvDB use years for season numbers
                 # which disagrees with other providers.  This workaround will
                 # avoid penalizing matches on airdate and episode name if any of
                 # the matches have seasons that look like years.
-                if any(code[0] > 1900 for code in codes):
+                if any(ep['season'] > 1900 for provider, ep in episodes):
                     continue
-                conflicts.setdefault((nn, airdate), []).extend(matches.pop((nn, airdate)))
+                disagree.append(key)
+        for key in disagree:
+            conflicts[key].extend(matches.pop(key))
 
 
         # Step 6: final pass over conflicts list (removing episodes that aren't
         # conflicting after all) and count the number of remaining conflicts
         # that are of seasons other than 0 (which are considered special
-        # features).
+        # features).  As with step 5, resolved conflicts are deleted after the
+        # loop.
         n_real_conflicts = 0
-        for (nn, airdate), episodes in list(conflicts.items()):
+        resolved = []
+        for (nn, airdate), episodes in conflicts.items():
             if nn is None:
                 # Air date for these episodes matched but name didn't.  Group all episodes
                 # for the same code ...
-                codes = {}
+                codes = defaultdict(list)
                 for provider, ep in episodes:
-                    codes.setdefault((ep['season'], ep['episode']), []).append((provider, ep))
+                    codes[(ep['season'], ep['episode'])].append((provider, ep))
                 # ... and do a much fuzzier name match for these episodes before we declare them to
                 # be a conflict.  Essentially if the names are remotely similar we probably want to
                 # consider them a match because the other important attributes (air date and episode
                 # code) are the same.
+                fuzzy = set() # {id(epdict), ...} matched below
                 for epcode, eps_for_code in codes.items():
                     if len(eps_for_code) <= 1:
                         # Only one episode for this code, so no hope of a match.
                         continue
-                    # List of aggressively normalized names for all episodes in this group
-                    nnames = [self._normalize_name(ep['name'], aggressive=True) for provider, ep in eps_for_code]
+                    # List of (aggressively normalized name, is unnamed) for all episodes in this group
+                    info = [aggressive[id(ep)] for provider, ep in eps_for_code]
 
                     # Allow unnamed episodes ("TBA" or "Season 1, Episode 1") to match other unnamed
                     # episodes or the real named episode in this group.  XXX: this is really kludgy,
                     # even by my standards. :(
                     #
                     # Get a list of non-unnamed episodes, or just use 'tba' if there are none.
-                    real = [x for x in nnames if x != 'tba' and not re.match(r'season\d+episode\d+', x)] or ['tba']
+                    real = [x for x, unnamed in info if not unnamed] or ['tba']
                     # Replace unnamed episode names with the first real named episode.
-                    for idx in range(len(nnames)):
-                        if nnames[idx] == 'tba' or re.match(r'season\d+episode\d+', nnames[idx]):
-                            nnames[idx] = real[0]
+                    nnames = [real[0] if unnamed else x for x, unnamed in info]
 
-                    for idx, (provider, ep) in enumerate(eps_for_code[:]):
+                    for idx, (provider, ep) in enumerate(eps_for_code):
                         matched_nn = difflib.get_close_matches(nnames[idx], nnames[:idx] + nnames[idx+1:], 10, 0.7)
                         if matched_nn:
                             # Fuzzy match, pick the smallest of all matches.  We can remove this episode
                             # from conflicts now.
-                            matched_nn = min(nnames[idx], *matched_nn)
+                            best = nnames[idx]
+                            for m in matched_nn:
+                                if m < best:
+                                    best = m
+                            matched_nn = best
                             # XXX: add epcode to force differeny key (kludge, find a cleaner way)
-                            matches.setdefault((matched_nn, airdate + str(epcode)), []).append((provider, ep))
-                            episodes.remove((provider, ep))
+                            matches[(matched_nn, airdate + str(epcode))].append((provider, ep))
+                            fuzzy.add(id(ep))
+                if fuzzy:
+                    # Remove the matched episodes from conflicts.
+                    episodes[:] = [(provider, ep) for provider, ep in episodes if id(ep) not in fuzzy]
                 if not episodes:
                     # All conflicts removed.
-                    del conflicts[(nn, airdate)]
+                    resolved.append((nn, airdate))
                     continue
 
             # Not elif because the above conditional block may have paired down
             # a number of conflicts to 1.
-            if len(episodes) == 1 or len(set(provider for provider, ep in episodes)) == 1:
+            if len(episodes) == 1 or all(provider == episodes[0][0] for provider, ep in episodes):
                 # Only one provider for this episode or all remaining episodes
                 # part of the same provider, so obviously not a conflict.  Move
                 # to unmatched.
                 for provider, ep in episodes:
                     unmatched.append((provider, nn, ep))
-                del conflicts[(nn, airdate)]
-            elif airdate and set(ep['season'] for provider, ep in episodes) != set([0]):
+                resolved.append((nn, airdate))
+            elif airdate and any(ep['season'] != 0 for provider, ep in episodes):
                 # At least one of the episodes isn't season 0, so this is a conflict.
                 # We also require airdate to be set, because if it's None, this is
                 # an air date conflict but the name and epcode matches, so it's not
                 # a serious conflict (not for our purposes anyway).
                 n_real_conflicts += 1
 
+        for key in resolved:
+            del conflicts[key]
+
         #return n_real_conflicts, conflicts, matches, unmatched
 
         #for (nn, airdate), episodes in sorted(matches.items(), key=lambda x:x[0][1]):
@@ -1032,27 +1148,30 @@ class TVDB(db.Database):
             print '- ', provider.NAME, ep['season'], ep['episode'], ep['airdate'], ep['name']
         """
 
-        n_episodes = max(len(series['episodes']) for series in pseries.values())
-        # XXX: pay attention to unmatched too, if the # episodes is high it suggests we
-        # are not comparing the same series.
-        categorized = sum(len(eplist) for eplist in itertools.chain(matches.values(), conflicts.values())) + len(unmatched)
-        # Raw count ignore eps with no name
-        raw = sum(1 for series in pseries.values() for ep in series['episodes'] if ep['name'])
-        log.debug('n_real_conflicts=%d matches=%d conflicts=%d unmatched=%d max=%d categorized=%d raw=%d' % (n_real_conflicts, len(matches), len(conflicts), len(unmatched), n_episodes, categorized, raw))
-        if categorized != raw:
-            alleps = list(itertools.chain(*[series['episodes'] for series in pseries.values()]))
-            log.error('_get_conflicts() lost episodes', len(alleps))
-            for eplist in matches.values() + conflicts.values():
-                for p, ep in eplist:
-                    try:
-                        alleps.remove(ep)
-                    except ValueError:
-                        log.debug('not missing: %s', ep)
-            for p, nn, ep in unmatched:
-                alleps.remove(ep)
-            for ep in alleps:
-                log.debug('missing: %s', ep)
-
+        # The sanity checks below need a couple extra passes over all episodes,
+        # so only bother when debug logging is enabled.
+        if log.isEnabledFor(logging.DEBUG):
+            n_episodes = max(len(series['episodes']) for series in pseries.values())
+            # XXX: pay attention to unmatched too, if the # episodes is high it suggests we
+            # are not comparing the same series.
+            categorized = sum(len(eplist) for eplist in itertools.chain(matches.values(), conflicts.values())) + len(unmatched)
+            # Raw count ignore eps with no name
+            raw = sum(1 for series in pseries.values() for ep in series['episodes'] if ep['name'])
+            log.debug('n_real_conflicts=%d matches=%d conflicts=%d unmatched=%d max=%d categorized=%d raw=%d',
+                      n_real_conflicts, len(matches), len(conflicts), len(unmatched), n_episodes, categorized, raw)
+            if categorized != raw:
+                alleps = list(itertools.chain.from_iterable(series['episodes'] for series in pseries.values()))
+                log.error('_get_conflicts() lost episodes (%d total)', len(alleps))
+                for eplist in itertools.chain(matches.values(), conflicts.values()):
+                    for p, ep in eplist:
+                        try:
+                            alleps.remove(ep)
+                        except ValueError:
+                            log.debug('not missing: %s', ep)
+                for p, nn, ep in unmatched:
+                    alleps.remove(ep)
+                for ep in alleps:
+                    log.debug('missing: %s', ep)
 
         return n_real_conflicts, conflicts, matches, unmatched
 
@@ -1234,24 +1353,29 @@ class TVDB(db.Database):
                 # up front to be sure.
                 maybe = []     # [dict, ...]
                 for result in results:
-                    # TODO: use difflib and allow fuzzy matches iff start airdate is exact match.
-                    # Year matches require exact names.  Similarly, we can do a fuzzy date match
-                    # if name is an exact match.
+                    # TODO: we can do a fuzzy date match if name is an exact match.
                     for result_name in result.names:
                         normresult = self._normalize_name(result_name)
                         normresultaggr = self._normalize_name(result_name, aggressive=True)
-                        log.debug2('%s: result %s [%s] (want %s [%s]) started %s (want %s)', p.NAME, normresult,
-                                   normresultaggr, normname, normnameaggr, result.started, started)
-                        if normname == normresult:
+                        # If rapidfuzz is available, also score the names with their words
+                        # sorted, which catches names with reordered words (e.g. "Office,
+                        # The").  Unlike a token set score, this doesn't give 100 when one
+                        # name is merely a subset of the other.  Scores are between 0 and 100.
+                        score = fuzz.token_sort_ratio(name, result_name, processor=fuzzutils.default_process) if fuzz else 0
+                        log.debug2('%s: result %s [%s] (want %s [%s]) score %d started %s (want %s)', p.NAME, normresult,
+                                   normresultaggr, normname, normnameaggr, score, result.started, started)
+                        if normname == normresult or score >= 95:
                             if started == result.started:
-                                # The non-aggressively normalized name matches and the airdate
-                                # matches, this is a solid match.
-                                matches.append((0, result))
+                                # The non-aggressively normalized name matches (or very nearly
+                                # matches) and the airdate matches, this is a solid match.
+                                # Prefer exact names (priority 0), then higher scores (priority
+                                # 1-6), so a fuzzy score of 100 can't tie with an exact name.
+                                matches.append((0 if normname == normresult else 101 - score, result))
                             else:
-                                # We have an exact title match but the airdate doesn't match.
+                                # We have a title match but the airdate doesn't match.
                                 maybe.append(result)
                             break
-                        elif normnameaggr == normresultaggr:
+                        elif normnameaggr == normresultaggr or score >= 85:
                             # If the aggressively normalized name matches and the start year
                             # matches, then add this to the maybe list for a more thorough
                             # comparison.
@@ -1261,14 +1385,15 @@ class TVDB(db.Database):
                 if matches:
                     # We match based on full air date or just year, but prefer
                     # the more specific match if it's available.
-                    matches.sort(key=lambda i: i[0])
-                    pids[p] = self._parse_id(matches[0][1].id)[1]
+                    priority, best = min(matches, key=lambda i: i[0])
+                    pids[p] = self._parse_id(best.id)[1]
                 elif maybe:
                     log.debug('no definitive matches for %s from %s, trying less likely options.', name, p.NAME)
                     for result in maybe:
                         log.debug('retrieving possible match %s (%s) from %s', result.name, result.id, p.NAME)
                         s = yield from p.get_series(self._parse_id(result.id)[1])
-                        tpseries = dict(list(pseries.items()) + [(p, s)])
+                        tpseries = dict(pseries)
+                        tpseries[p] = s
                         if not pseries and existing and preferred.CACHEATTR in existing:
                             # We have existing series data but pseries is empty, which means
                             # that all existing series data was marked as dirty.  But we
@@ -1339,7 +1464,9 @@ class TVDB(db.Database):
                     # Merge all attributes from episodes, prioritizing the
                     # preferred provider if the attribute exists.
                     merged = {}
-                    for p, ep in sorted(eplist, key=lambda xep: xep[0] != preferred):
+                    ordered = [xep for xep in eplist if xep[0] == preferred] + \
+                              [xep for xep in eplist if xep[0] != preferred]
+                    for p, ep in ordered:
                         for k, v in ep.items():
                             if k not in merged or (v and merged.get(k) is None):
                                 merged[k] = v
@@ -1396,11 +1523,17 @@ class TVDB(db.Database):
         # There may be (probably are) other corner cases as well that could cause
         # orphaned rows.
         orphans = self.query(type='episode', parent=parent, id=db.QExpr('not in', dbids))
+        if orphans:
+            # Fetch the remaining episodes in one query, indexed by episode code,
+            # so we can check orphans against any duplicates without a query per
+            # orphan.
+            kept = {}
+            for ep in self.query(type='episode', parent=parent, id=db.QExpr('in', dbids)):
+                kept.setdefault((ep['season'], ep['episode']), []).append(ep)
         for orphan in orphans:
             epinfo = '%s s%02de%02d: %s' % (series['name'], orphan['season'], orphan['episode'], orphan['name'])
             log.debug('removing orphaned entry for %s', epinfo)
-            dupes = self.query(type='episode', parent=parent, id=db.QExpr('!=', orphan['id']),
-                               season=orphan['season'], episode=orphan['episode'])
+            dupes = kept.get((orphan['season'], orphan['episode']))
             if dupes:
                 # FIXME: ugly, and will only get uglier as we add other attributes to check
                 if (orphan['status'] != Episode.STATUS_NONE and orphan['status'] not in (d['status'] for d in dupes)) or \
@@ -1410,7 +1543,8 @@ class TVDB(db.Database):
                     # blacklist, search_result.  This might not actually be a problem, but until we
                     # handle it properly, log a warning.
                     log.warning('FIXME: removal of obsolete episode (%s) discards local attributes', epinfo)
-            self.delete(orphan)
+        if orphans:
+            self.delete_many(orphans)
 
         self.purge_caches()
 
@@ -1511,15 +1645,16 @@ class TVDB(db.Database):
         # Go through all changed ids for all providers and construct a dict
         # that maps Series objects to a list of dirty providers.
         log.info('syncing with TV metadata providers')
-        changed = {}  # series -> [provider, ...]
+        changed = defaultdict(list)  # series -> [provider, ...]
         self._build_series_cache()
         for provider, ids in (yield from self._invoke_providers('get_changed_series_ids')):
-            if not ids:
+            cache = self._series_cache_by_provider.get(provider.NAME)
+            if not ids or not cache:
                 continue
             for id in ids:
-                series = self._series_cache.get('%s:%s' % (provider.NAME, id))
-                if series:
-                    changed.setdefault(series, []).append(provider)
+                series = cache.get(str(id))
+                if series is not None:
+                    changed[series].append(provider)
 
         # Now update all changed series.
         # (mine series cache for ids)
@@ -1568,6 +1703,7 @@ class TVDB(db.Database):
         # if the version has changed, so we just need to bump the version
         # to effectively purge cache.
         self._version += 1
+        self._series_cfg_index = None
         self._build_series_cache()
 
 
@@ -1581,10 +1717,28 @@ class TVDB(db.Database):
             return 0
 
 
+    def _invalidate_series_cfg_index(self, name, oldval, newval):
+        self._series_cfg_index = None
+
+
+    def _get_series_cfg_index(self):
+        # Removing a series group from config.series doesn't notify monitors,
+        # so also rebuild the index if the number of series has changed.
+        if self._series_cfg_index is None or self._series_cfg_index_len != len(config.series):
+            index = {}
+            for n, cfg in enumerate(config.series):
+                # Earlier config entries take precedence, as with a linear scan.
+                index.setdefault(cfg.id.lower().strip(), (n, cfg))
+            self._series_cfg_index = index
+            self._series_cfg_index_len = len(config.series)
+        return self._series_cfg_index
+
+
     def get_config_for_series(self, id=None, series=None):
         assert(id or series)
         if not series:
             series = self._series_cache[id]
-        for cfg in config.series:
-            if cfg.id.lower().strip() in series.ids:
-                return cfg
+        index = self._get_series_cfg_index()
+        matches = [index[sid] for sid in series.ids if sid in index]
+        if matches:
+            return min(matches)[1]
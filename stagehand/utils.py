@@ -7,11 +7,17 @@ import xml.sax
 import xml.sax.saxutils
 import asyncio
 import importlib
+import functools
 from zipfile import ZipFile
 from datetime import datetime
 
 from .toolbox.config import get_description
 
+# Paragraph breaks in config descriptions, for cfgdesc2html()
+_PARA_RE = re.compile(r'\n\s*\n')
+# Characters stripped by name_to_url_segment()
+_NONWORD_RE = re.compile(r'\W')
+
 
 class Element:
     """
@@ -293,22 +299,25 @@ def fixsep(s, path=True):
     return s
 
 
+# Maps "smart" quotes, ellipses, etc. to their ASCII equivalents, for use
+# with str.translate() in fixquotes().
+_FIXQUOTES_TABLE = {
+    # Double quotes
+    0x201c: '"', 0x201d: '"',
+    # Single quotes
+    0x2018: "'", 0x2019: "'",
+    # Endash
+    0x2014: '--',
+    # Ellipses
+    0x2026: '...'
+}
+
 def fixquotes(u):
     """
     Given a unicode string, replaces "smart" quotes, ellipses, etc.
     with ASCII equivalents.
     """
-    if not u:
-        return u
-    # Double quotes
-    u = u.replace('\u201c', '"').replace('\u201d', '"')
-    # Single quotes
-    u = u.replace('\u2018', "'").replace('\u2019', "'")
-    # Endash
-    u = u.replace('\u2014', '--')
-    # Ellipses
-    u = u.replace('\u2026', '...')
-    return u
+    return u.translate(_FIXQUOTES_TABLE) if u else u
 
 
 def remove_stop_words(s):
@@ -327,9 +336,10 @@ def cfgdesc2html(item):
     (double newline) converted to <br> for use in HTML.
     """
     desc = get_description(item)
-    return re.sub(r'\n\s*\n', '<br/><br/>', desc)
+    return _PARA_RE.sub('<br/><br/>', desc)
 
 
+@functools.lru_cache(maxsize=1024)
 def name_to_url_segment(name):
     """
     Given some kind of name, return a lower case string without any punctuation
@@ -338,7 +348,7 @@ def name_to_url_segment(name):
     name = name.lower().replace('&', 'and').replace(' ', '_')
     if name.startswith('the_'):
         name = name[4:]
-    return re.sub(r'\W', '', name)
+    return _NONWORD_RE.sub('', name)
 
 
 def episode_status_icon_info(ep):
@@ -2,6 +2,7 @@ import os
 import time
 import mimetypes
 import time
+import zlib
 import logging
 import asyncio
 
@@ -12,8 +13,10 @@ from ..tvdb import Episode
 
 log = logging.getLogger('stagehand.web.app')
 
-def get_series_from_request(id):
-    series = web.request['stagehand.manager'].tvdb.get_series_by_id(id)
+def get_series_from_request(id, manager=None):
+    if manager is None:
+        manager = web.request['stagehand.manager']
+    series = manager.tvdb.get_series_by_id(id)
     if not series:
         raise web.HTTPError(404, 'Invalid show.')
     return series
@@ -38,7 +41,7 @@ def show_add(job, id):
 @webcoroutine()
 def show_delete(job, id):
     manager = web.request['stagehand.manager']
-    name = get_series_from_request(id).name
+    name = get_series_from_request(id, manager).name
     manager.delete_series(id)
     # Notify the session about the removal, but do it via a timer so that
     # the notification happens on the next page load rather than in response
@@ -49,16 +52,24 @@ def show_delete(job, id):
 
 @web.get('/api/shows/<id>/banner', cache=3600*24*7)
 def show_banner(id):
-    # TODO: support cache check
     series = get_series_from_request(id)
-    if not series.banner_data:
+    data = series.banner_data
+    if not data:
         raise web.HTTPError(404, 'Invalid show, or no banner for this show.')
 
-    web.response['Content-Length'] = len(series.banner_data)
+    # The banner can change when the series is refreshed, so derive the ETag
+    # from its contents.
+    etag = '"%x-%x"' % (zlib.crc32(data), len(data))
+    web.response['ETag'] = etag
+    if web.request.headers.get('If-None-Match') == etag:
+        web.response.status = 304
+        return b''
+
+    web.response['Content-Length'] = len(data)
     mimetype, encoding = mimetypes.guess_type(series.banner)
     if mimetype:
         web.response.content_type = mimetype
-    return series.banner_data
+    return data
 
 
 @web.post('/api/shows/<id>/provider')
@@ -123,17 +134,15 @@ def show_search(job):
     results = yield from manager.tvdb.search(q.name)
     job.notify('alert', title='Search results', text='Search took %.3fs' % (time.time() - t0))
     # JSONify the SearchResult objects
-    dictlist = []
-    for r in results:
-        dictlist.append({
-            'id': r.id,
-            'name': r.name,
-            'overview': r.overview,
-            'year': r.year,
-            'imdb': r.imdb,
-            'provider': r.provider.NAME,
-            'started': r.started
-        })
+    dictlist = [{
+        'id': r.id,
+        'name': r.name,
+        'overview': r.overview,
+        'year': r.year,
+        'imdb': r.imdb,
+        'provider': r.provider.NAME,
+        'started': r.started
+    } for r in results]
     return {'results': dictlist}
 
 
@@ -142,19 +151,19 @@ def show_search(job):
 def show_check(job):
     manager = web.request['stagehand.manager']
     if web.request.query.id:
-        only = [get_series_from_request(web.request.query.id)]
+        only = [get_series_from_request(web.request.query.id, manager)]
     else:
         only = []
 
     need, found = yield from manager.check_new_episodes(only=only)
-    return {'need': sum(len(eps) for eps in need.values()), 'found': len(found)}
+    return {'need': sum(map(len, need.values())), 'found': len(found)}
 
 
 @web.post('/api/shows/<id>/episodes/<epcode>/status')
 @webcoroutine()
 def show_episodes_status(job, id, epcode):
     manager = web.request['stagehand.manager']
-    series = get_series_from_request(id)
+    series = get_series_from_request(id, manager)
     eps = [series.get_episode_by_code(code) for code in epcode.split(',')]
     if None in eps:
         raise web.HTTPError(404, 'Unknown episode for this show.')
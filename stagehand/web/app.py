@@ -4,6 +4,7 @@ import hashlib
 import functools
 import mimetypes
 import itertools
+import operator
 import time
 import logging
 import asyncio
@@ -16,13 +17,17 @@ from . import server as web
 from . import api
 from .async import asyncweb, webcoroutine
 from .settings import rename_example
-from .utils import SessionPlugin, CachePlugin, shview, static_file_from_zip, abspath_to_zippath
+from .utils import SessionPlugin, CachePlugin, shview, static_file_from_zip, abspath_to_zippath, STATIC_IMMUTABLE
 from ..utils import episode_status_icon_info
-from ..coffee import cscompile_with_cache
+from ..coffee import cscompile_with_cache, cscompile_from_memo
 from ..config import config
 
 log = logging.getLogger('stagehand.web.app')
 
+# For episodes without an airdate, just use 1900-01-01 for sorting purposes,
+# so they sort last.
+_NO_AIRDATE = datetime(1900, 1, 1)
+
 web.install(SessionPlugin())
 web.install(CachePlugin())
 
@@ -33,6 +38,8 @@ def static(filename):
     root = os.path.join(manager.paths.data, 'web')
     ziproot = abspath_to_zippath(root)
     response = None
+    # URLs from static_url() are fingerprinted, and can be cached forever.
+    cache = STATIC_IMMUTABLE if web.request.query.v else 'max-age=3600'
 
     if ziproot:
         try:
@@ -54,11 +61,7 @@ def static(filename):
                 # static_file() will return a 404.
                 response = web.static_file(filename + '.compiled', root=root)
             else:
-                cached, data = cscompile_with_cache(src, web.request['coffee.cachedir'])
-                web.response.logextra = '(CS %s)' % 'cached' if cached else 'compiled on demand'
-                web.response.content_type = 'application/javascript'
-                web.response['Cache-Control'] = 'max-age=3600'
-                return data
+                return _static_coffee(src, cache)
         else:
             response = web.static_file(filename, root=root)
 
@@ -69,11 +72,30 @@ def static(filename):
         if 'gzip' not in web.request.headers.get('Accept-Encoding', ''):
             import gzip
             response.body = gzip.GzipFile(fileobj=response.body)
+    if web.request.query.v and not isinstance(response, web.HTTPError):
+        response.set_header('Cache-Control', cache)
     #elif filename.endswith('.coffee'):
     #    response['X-SourceMap'] = '/static/' + filename + '.map'
     return response
 
 
+@asyncio.coroutine
+def _static_coffee(src, cache):
+    data = cscompile_from_memo(src)
+    if data is not None:
+        cached = True
+    else:
+        # Reading the compiled file from the cache (or worse, compiling it)
+        # blocks, so do it in a thread rather than stalling the main loop.
+        loop = asyncio.get_event_loop()
+        cachedir = web.request['coffee.cachedir']
+        cached, data = yield from loop.run_in_executor(None, cscompile_with_cache, src, cachedir)
+    web.request['stagehand.log']['extra'] = '(CS %s)' % ('cached' if cached else 'compiled on demand')
+    web.response.content_type = 'application/javascript'
+    web.response['Cache-Control'] = cache
+    return data
+
+
 @web.get('/')
 @shview('home.tmpl')
 def home():
@@ -125,31 +147,34 @@ def downloads():
     today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     # The most recent past Sunday (or today, if today is Sunday)
     sunday = today if today.weekday() == 6 else today - timedelta(days=today.weekday() + 1)
+    sunday_ord = sunday.toordinal()
+    # Fetch the retrieve queue once rather than scanning it for every episode.
+    queued = manager.get_queued_episode_set()
     episodes = []
     for s in manager.tvdb.series:
+        if s.cfg.paused:
+            # Don't show episodes for paused series, even if they are needed.
+            continue
         for ep in s.episodes:
-            if ep.status != ep.STATUS_NEED_FORCED and (not ep.aired or manager.is_episode_queued_for_retrieval(ep)):
-                continue
-            if s.cfg.paused:
-                # Don't show episodes for paused series, even if they are needed.
+            if ep.status != ep.STATUS_NEED_FORCED and (not ep.aired or ep in queued):
                 continue
             icon, title = episode_status_icon_info(ep)
-            if ep.airdate:
+            airdate = ep.airdate
+            if airdate:
                 # week 0 is anything on or after sunday
-                week = (max(0, (sunday - ep.airdate).days) + 6) // 7
+                week = (max(0, sunday_ord - airdate.toordinal()) + 6) // 7
                 if (icon in ('ignore', 'have') and week >= weeks) or (icon == 'ignore' and status == 'have'):
                     continue
             else:
                 # Episode is STATUS_NEED_FORCED without an airdate.
                 week = None
-            episodes.append((ep, icon, title, week))
-    # For episodes without an airdate, just use 1900-01-01 for sorting
-    # purposes, so they sorted last.
-    episodes.sort(key=lambda i: (i[0].airdatetime or datetime(1900, 1, 1), i[0].name), reverse=True)
+            # Compute the sort key up front, paired with the template payload.
+            episodes.append(((ep.airdatetime or _NO_AIRDATE, ep.name), (ep, icon, title, week)))
+    episodes.sort(key=operator.itemgetter(0), reverse=True)
     return {
         'weeks': weeks,
         'status': status,
-        'episodes': episodes
+        'episodes': [payload for key, payload in episodes]
     }
 
 
@@ -1,19 +1,35 @@
 import os
+import sys
 import time
 import hashlib
 import functools
 import mimetypes
 import itertools
+import json
 import time
 import logging
 import asyncio
+import heapq
+from collections import OrderedDict, deque
 
 from . import server as web
 
 log = logging.getLogger('stagehand.web.app')
 
-def renumerate(i):
-    return zip(reversed(range(len(i))), reversed(i))
+
+def _session():
+    """
+    Returns the (interned) session id for the current request.
+
+    Session ids key the job and notification queues and are looked up on
+    every poll, so they're interned, and the result is kept in the request
+    environ so that subsequent lookups within the same request are free.
+    """
+    environ = web.request.environ
+    session = environ.get('stagehand.session.cached')
+    if session is None:
+        session = environ['stagehand.session.cached'] = sys.intern(web.request.cookies['stagehand.session'])
+    return session
 
 
 class AsyncWebJob:
@@ -23,7 +39,34 @@ class AsyncWebJob:
         self.finished = False
         self.error = None
         self.result = None
-        [setattr(self, k, v) for k, v in kwargs.items()]
+        # Notification sequence number, None for jobs
+        self.seq = None
+        self._json = None
+        self.__dict__.update(kwargs)
+
+    @property
+    def payload(self):
+        """
+        The entry for this job (or notification) in a /api/jobs response.
+        """
+        if self.seq is not None:
+            # Notification
+            return self.result
+        elif self.error:
+            return {'id': self.id, 'error': self.error}
+        else:
+            return {'id': self.id, 'result': self.result}
+
+    @property
+    def json(self):
+        """
+        The payload serialized as JSON.  Results don't change once a job is
+        finished, so this is done only once, even for global notifications
+        delivered to many sessions.
+        """
+        if self._json is None:
+            self._json = json.dumps(self.payload)
+        return self._json
 
     def notify(self, ntype, **kwargs):
         asyncweb.notify(ntype, session=self.session, id=self.id, **kwargs)
@@ -38,49 +81,91 @@ class AsyncWebJob:
             self.error = {'message': '%s: %s' % (e.__class__.__name__, ', '.join(str(s) for s in e.args))}
             log.exception('webcoroutine exception')
         self.finished = True
+        asyncweb.wake(self.session)
 
 
 class AsyncWeb:
     job_timeout = 1800
     notification_timeout = 60
+    # Upper bound on how long a /api/jobs request may wait for activity
+    wait_timeout = 25
 
     def __init__(self):
         super().__init__()
+        # session -> OrderedDict(job id -> AsyncWebJob), oldest first
         self._job_queue = {}
+        # session (or None for global) -> deque of AsyncWebJob, oldest first
         self._notification_queue = {}
+        # session -> seq of the newest global notification the session has
+        # been given.  Global notifications are numbered from _next_id, so
+        # a session hasn't seen any notification with a higher seq.
+        self._global_seen_seq = {}
+        # Min-heap of (expiry time, id, session) for every queued job and
+        # notification, so cleanup only needs to look at the head.  The id is
+        # the job id or the notification's seq, which never collide as both
+        # come from _next_id.
+        self._expiry_heap = []
+        # session -> list of futures for /api/jobs requests waiting for a
+        # job to finish or a notification to arrive
+        self._waiters = {}
         # Begin job ids at the current timestamp to prevent conflicting
         # job ids between instance restarts.
         self._next_id = itertools.count(int(time.time())).__next__
         self._cleanup_timer = None
-        self._loop = asyncio.get_event_loop()
+
+
+    @property
+    def _loop(self):
+        # Looked up on use rather than stored at construction: asyncweb is
+        # created at import time, before main() has decided which event loop
+        # (stock or uvloop) Stagehand will run on.
+        return asyncio.get_event_loop()
+
+
+    def _schedule_expiry(self, expires, id, session):
+        heapq.heappush(self._expiry_heap, (expires, id, session))
+        if not self._cleanup_timer:
+            self._cleanup_timer = self._loop.call_later(60, self._cleanup)
 
 
     def _cleanup(self):
         now = time.time()
-        def purge(q, timeout):
-            [q.pop(i) for i, job in renumerate(q) if now - job.timestamp > timeout]
-            return q
-        for session, queue in list(self._job_queue.items()):
-            if not purge(queue, self.job_timeout):
-                log.debug('purging timed out job: %s', self._job_queue[session])
-                del self._job_queue[session]
-        for session, queue in list(self._notification_queue.items()):
-            if not purge(queue, self.notification_timeout):
+        heap = self._expiry_heap
+        while heap and heap[0][0] < now:
+            expires, id, session = heapq.heappop(heap)
+            # The job or notification may have already been picked up by the
+            # client, in which case there's nothing to do.
+            q = self._job_queue.get(session)
+            if q and q.pop(id, None):
+                log.debug('purging timed out job: %s', id)
+                if not q:
+                    del self._job_queue[session]
+                continue
+            # Notifications are queued in the order they're created, so the
+            # expired ones are always at the front of the queue.
+            q = self._notification_queue.get(session)
+            while q and now - q[0].timestamp > self.notification_timeout:
+                q.popleft()
+            if q is not None and not q:
                 del self._notification_queue[session]
-        if self._job_queue or self._notification_queue:
-            # More cleanup needed, restart timer.
-            self._cleanup_timer = self._loop.call_later(60, self._cleanup)
+        if None not in self._notification_queue:
+            # Any future global notification will be newer than what every
+            # session has seen, so there's nothing left to track.
+            self._global_seen_seq.clear()
+        if heap:
+            # More cleanup needed, restart timer for when the next item
+            # expires, but not more often than once a minute.
+            self._cleanup_timer = self._loop.call_later(max(60, heap[0][0] - now), self._cleanup)
         else:
             self._cleanup_timer = None
 
 
 
     def new_job(self):
-        session = web.request.cookies['stagehand.session']
+        session = _session()
         job = AsyncWebJob(session=session, id=self._next_id())
-        self._job_queue.setdefault(session, []).append(job)
-        if not self._cleanup_timer:
-            self._cleanup_timer = self._loop.call_later(60, self._cleanup)
+        self._job_queue.setdefault(session, OrderedDict())[job.id] = job
+        self._schedule_expiry(job.timestamp + self.job_timeout, job.id, session)
         return job
 
 
@@ -88,45 +173,148 @@ class AsyncWeb:
         future.add_done_callback(job.finish)
 
 
-    def pop_finished_jobs(self, session, jobs=''):
-        if not session:
-            return []
+    def pop_finished_job_json(self, job, prefix=''):
+        """
+        Returns the JSON response for a single finished job, as
+        pop_finished_jobs_json() would, but without the job id parsing and
+        queue scans when there are no notifications to deliver along with it.
+        """
+        if job.session in self._notification_queue or None in self._notification_queue:
+            return self.pop_finished_jobs_json(job.session, str(job.id), prefix)
+        q = self._job_queue.get(job.session)
+        if q and q.pop(job.id, None) and not q:
+            del self._job_queue[job.session]
+        return self._render_json([job], [], prefix)
+
+
+    def _pop_finished(self, session, jobs):
+        """
+        Returns a list of finished jobs out of the given job ids, and a list of
+        notifications (newest first) for the session, removing them from the
+        queues.
+        """
         jobs = [int(j) for j in (jobs or '').split(',') if j.strip()]
-        response = {'jobs': [], 'notifications': []}
+        jobs_set = frozenset(jobs)
+        finished = []
+        notifications = []
 
-        # It's safe to pop from a list you're iterating provided you do
-        # it in reverse (otherwise your index would reference a different
-        # element after popping).  Ugly, but efficient.
         if session in self._job_queue:
             q = self._job_queue[session]
-            for i, job in renumerate(q):
-                if job.finished and job.id in jobs:
-                    if job.error:
-                        response['jobs'].append({'id': job.id, 'error': job.error})
-                    else:
-                        response['jobs'].append({'id': job.id, 'result': job.result})
-                    q.pop(i)
+            for id in jobs:
+                job = q.get(id)
+                if job and job.finished:
+                    finished.append(job)
+                    del q[id]
             if not q:
                 del self._job_queue[session]
 
-        # Get all notifications for this session.
+        # Get all global notifications not seen by this session, and drop the
+        # expired ones from the front of the queue.
+        if None in self._notification_queue:
+            q = self._notification_queue[None]
+            last = self._global_seen_seq.get(session, -1)
+            notifications.extend(n for n in q if n.seq > last or n.universal)
+            if q:
+                self._global_seen_seq[session] = q[-1].seq
+            now = time.time()
+            while q and now - q[0].timestamp > self.notification_timeout:
+                q.popleft()
+
+        # Get all notifications for this session, newest first.
         if session in self._notification_queue:
             q = self._notification_queue[session]
-            response['notifications'].extend(q.pop(i).result for i, n in renumerate(q)
-                                                             if n.id is None or n.id in jobs)
-            if not q:
+            keep = deque()
+            mine = []
+            for n in q:
+                if n.id is None or n.id in jobs_set:
+                    mine.append(n)
+                else:
+                    keep.append(n)
+            mine.reverse()
+            notifications.extend(mine)
+            if keep:
+                self._notification_queue[session] = keep
+            else:
                 del self._notification_queue[session]
 
-        # Get all global notifications not seen by this session.
-        global_notifications = self._notification_queue.get(None, [])
-        for i, n in renumerate(global_notifications):
-            if session not in n.seen or n.universal:
-                response['notifications'].insert(0, n.result)
-                n.seen.add(session)
-            if time.time() - n.timestamp > self.notification_timeout:
-                global_notifications.pop(i)
+        return finished, notifications
+
+
+    def pop_finished_jobs(self, session, jobs=''):
+        if not session:
+            return []
+        finished, notifications = self._pop_finished(sys.intern(session), jobs)
+        return {
+            'jobs': [job.payload for job in finished],
+            'notifications': [n.payload for n in notifications]
+        }
+
+
+    @staticmethod
+    def _render_json(finished, notifications, prefix=''):
+        # prefix holds any additional members for the response object, already
+        # serialized and including the trailing comma.
+        return '{%s"jobs": [%s], "notifications": [%s]}' % (prefix, ', '.join(job.json for job in finished),
+                                                           ', '.join(n.json for n in notifications))
+
+
+    def pop_finished_jobs_json(self, session, jobs='', prefix=''):
+        """
+        Like :meth:`pop_finished_jobs`, but returns the response already
+        serialized as JSON, reusing each job's and notification's cached JSON.
+        """
+        if not session:
+            return '[]'
+        finished, notifications = self._pop_finished(sys.intern(session), jobs)
+        return self._render_json(finished, notifications, prefix)
+
+
+    @asyncio.coroutine
+    def wait_finished_jobs_json(self, session, jobs='', timeout=0):
+        """
+        Like :meth:`pop_finished_jobs_json`, but if there is nothing to return,
+        waits up to *timeout* seconds (capped at :attr:`wait_timeout`) for a job
+        to finish or a notification to arrive.
 
-        return response
+        Returns after any wake for the session, even if none of the given jobs
+        finished, so that the client can poll again with its current job ids.
+        """
+        if not session:
+            return '[]'
+        session = sys.intern(session)
+        finished, notifications = self._pop_finished(session, jobs)
+        timeout = min(timeout, self.wait_timeout)
+        if finished or notifications or timeout <= 0:
+            return self._render_json(finished, notifications)
+        future = asyncio.Future(loop=self._loop)
+        self._waiters.setdefault(session, []).append(future)
+        try:
+            yield from asyncio.wait_for(future, timeout, loop=self._loop)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters = self._waiters.get(session)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[session]
+        finished, notifications = self._pop_finished(session, jobs)
+        return self._render_json(finished, notifications)
+
+
+    def wake(self, session):
+        """
+        Wakes any :meth:`wait_finished_jobs_json` callers for the given session, or
+        for all sessions if session is None.
+        """
+        if session is None:
+            waiters = [f for futures in self._waiters.values() for f in futures]
+            self._waiters.clear()
+        else:
+            waiters = self._waiters.pop(session, ())
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
 
 
     def notify(self, ntype, **kwargs):
@@ -152,21 +340,25 @@ class AsyncWeb:
         :type universal: bool
         """
         session = kwargs.pop('session', None)
+        if session:
+            session = sys.intern(session)
+        ntype = sys.intern(ntype)
         replace = kwargs.pop('replace', False)
         universal = kwargs.pop('universal', False)
-        n = AsyncWebJob(session=session, id=kwargs.pop('id', None), seen=set(), universal=universal)
+        seq = self._next_id()
+        n = AsyncWebJob(session=session, id=kwargs.pop('id', None), seq=seq, universal=universal)
         n.result = {
             '_ntype': ntype,
-            '_nid': self._next_id()
+            '_nid': seq
         }
         n.result.update(kwargs)
         if replace and session in self._notification_queue:
             # Remove any notification for this type from the queue.
-            self._notification_queue[session] = [job for job in self._notification_queue[session]
-                                                     if n.result['_ntype'] != ntype]
-        self._notification_queue.setdefault(session, []).append(n)
-        if not self._cleanup_timer:
-            self._cleanup_timer = self._loop.call_later(60, self._cleanup)
+            self._notification_queue[session] = deque(job for job in self._notification_queue[session]
+                                                          if job.result['_ntype'] != ntype)
+        self._notification_queue.setdefault(session, deque()).append(n)
+        self._schedule_expiry(n.timestamp + self.notification_timeout, seq, session)
+        self.wake(session)
 
     def notify_after(self, ntype, **kwargs):
         timeout = kwargs.pop('timeout', 0)
@@ -181,7 +373,7 @@ def webcoroutine(interval=1000, blockfor=0):
         corofunc = asyncio.coroutine(func)
         def wrapper(*args, **kwargs):
             job = asyncweb.new_job()
-            response = {'jobid': job.id, 'interval': interval, 'pending': False}
+            pending = False
 
             coro = corofunc(job, *args, **kwargs)
             task = asyncio.Task(coro)
@@ -201,12 +393,22 @@ def webcoroutine(interval=1000, blockfor=0):
                 job.finish(task)
             else:
                 asyncweb.watch_job(task, job)
-                response['pending'] = True
-
-            # Get job results for all supplied job ids plus this new one.
-            jobs = web.request.query.jobs + ',%s' % job.id
-            response.update(asyncweb.pop_finished_jobs(job.session, jobs))
-            log.debug('webcoroutine response: %s', response)
+                pending = True
+
+            # The response has a fixed shape, so it's assembled as JSON
+            # directly, using the cached JSON of the job results and
+            # notifications.
+            web.response.content_type = 'application/json'
+            prefix = '"jobid": %d, "interval": %d, "pending": %s, ' % (job.id, interval, 'true' if pending else 'false')
+            if job.finished and not web.request.query.jobs:
+                # Common case: the job finished inline and the client isn't
+                # asking about any others.
+                response = asyncweb.pop_finished_job_json(job, prefix)
+            else:
+                # Get job results for all supplied job ids plus this new one.
+                jobs = web.request.query.jobs + ',%s' % job.id
+                response = asyncweb.pop_finished_jobs_json(job.session, jobs, prefix)
+            log.debug('webcoroutine response: jobid=%s pending=%s', job.id, pending)
             return response
         return wrapper
     return decorator
@@ -214,9 +416,22 @@ def webcoroutine(interval=1000, blockfor=0):
 
 @web.get('/api/jobs')
 def jobs():
-    session = web.request.cookies['stagehand.session']
-    response = asyncweb.pop_finished_jobs(session, web.request.query.jobs)
+    session = _session()
     # This gets executed quite frequently by the client, so lower the log level
     # to reduce spamminess.
-    web.response.loglevel = logging.DEBUG
+    web.request['stagehand.log']['level'] = logging.DEBUG
+    # Clients may ask to wait (in seconds) for something to happen rather than
+    # getting an empty response straight away.
+    # Job results and notifications cache their own JSON, so the response is
+    # assembled from those rather than serialized as a whole.
+    web.response.content_type = 'application/json'
+    # Responses are per-session and consume the jobs and notifications they
+    # deliver, so they must never be shared or reused.
+    web.response['Cache-Control'] = 'private,max-age=0,no-cache,no-store'
+    web.response['Vary'] = 'Cookie'
+    wait = web.request.query.wait
+    if wait.isdigit() and int(wait) > 0:
+        response = yield from asyncweb.wait_finished_jobs_json(session, web.request.query.jobs, int(wait))
+    else:
+        response = asyncweb.pop_finished_jobs_json(session, web.request.query.jobs)
     return response
@@ -7,6 +7,7 @@ import traceback
 import json
 import logging
 import socket
+import hmac
 from hashlib import md5
 
 from aiohttp.wsgi import WSGIServerHttpProtocol
@@ -30,20 +31,27 @@ class LoggingMiddleware:
 
 
     def __call__(self, environ, start_response):
-        # Default log level for this call.  The handler can modify it.
-        bottle.response.loglevel = logging.INFO
-        bottle.response.logextra = None
+        # Per-request log options, which the handler can modify (see
+        # Server.run()).  These live in the environ rather than on
+        # bottle.response, which is shared between interleaved coroutine
+        # handlers.
+        logopts = environ['stagehand.log']
         t0 = time.time()
 
         def _start_response(status, headers, *args):
+            loglevel = logopts['level']
+            if not self._httplog.isEnabledFor(loglevel):
+                # Frequent requests (like /api/jobs polls) are logged at a
+                # lower level, so don't bother building the line.
+                return start_response(status, headers, *args)
             uri = environ['PATH_INFO'] + ('?%s' % environ['QUERY_STRING'] if environ['QUERY_STRING'] else '')
             code = status.split()[0]
-            size = dict(headers).get('Content-Length', '-')
-
-            self._httplog.log(bottle.response.loglevel, '%s "%s %s %s" %s %s %.02fms%s',
+            size = next((v for k, v in headers if k == 'Content-Length'), '-')
+            logextra = logopts['extra']
+            self._httplog.log(loglevel, '%s "%s %s %s" %s %s %.02fms%s',
                               environ['REMOTE_ADDR'], environ['REQUEST_METHOD'],
                               uri, environ['SERVER_PROTOCOL'], code, size, (time.time()-t0) * 1000.0,
-                              ' ' + bottle.response.logextra if bottle.response.logextra else '')
+                              ' ' + logextra if logextra else '')
             return start_response(status, headers, *args)
 
         return self._application(environ, _start_response)
@@ -54,8 +62,9 @@ class AuthMiddleware:
     def __init__(self, application, user, passwd):
         self._application = application
         self._nonce_passwd = os.urandom(64)
-        self._user = user.encode()
-        self._passwd = passwd.encode()
+        self._realm = b'Secure Area'
+        # HA1 depends only on the credentials and realm, so compute it once.
+        self._ha1 = md5(b':'.join([user.encode(), self._realm, passwd.encode()])).hexdigest().encode()
 
 
     def __call__(self, environ, start_response):
@@ -75,10 +84,11 @@ class AuthMiddleware:
         parts = (f.strip().split('=', 1) for f in response[7:].split(',') if '=' in f)
         # Remove enclosing quotes and toss into a dict.
         rdict = dict((k.lower(), tobytes(v.strip('"'))) for k, v in parts)
-        HA1 = md5(b':'.join([self._user, rdict.get('realm'), self._passwd])).hexdigest()
+        if rdict.get('realm') != self._realm:
+            return False
         HA2 = md5(b':'.join([environ.get('REQUEST_METHOD').encode(), rdict.get('uri')])).hexdigest()
-        expected = md5(b':'.join([HA1.encode(), rdict.get('nonce'), HA2.encode()])).hexdigest()
-        return rdict.get('response') == expected.encode()
+        expected = md5(b':'.join([self._ha1, rdict.get('nonce'), HA2.encode()])).hexdigest()
+        return hmac.compare_digest(rdict.get('response', b''), expected.encode())
 
 
     def _auth_failed(self, environ, start_response):
@@ -86,7 +96,7 @@ class AuthMiddleware:
         nonce = now + b'/' + tobytes(md5(now + self._nonce_passwd).hexdigest())
         # TODO: advertise qop and support cnonce
         response_headers = [
-            ('WWW-Authenticate', 'Digest realm="Secure Area", nonce="%s", algorithm=MD5' % tostr(nonce)),
+            ('WWW-Authenticate', 'Digest realm="%s", nonce="%s", algorithm=MD5' % (tostr(self._realm), tostr(nonce))),
             ('Content-Type', 'text/html')
         ]
         start_response('401 Authorization Required', response_headers)
@@ -230,11 +240,16 @@ class Server(bottle.ServerAdapter):
 
     def _create_server_done(self, f):
         self._task = None
+        if f.cancelled():
+            return
         try:
             self._server = f.result()
+        except OSError as e:
+            # The exception is also propagated to whoever is waiting on
+            # start(), which decides whether to try another port.
+            log.error('could not start webserver at %s:%s: %s', self.host or '*', self.port, e)
+        else:
             log.info('started webserver at http://%s:%s/', self.host or socket.gethostname(), self.port)
-        except:
-            pass
 
 
     def start(self, **kwargs):
@@ -266,6 +281,9 @@ class Server(bottle.ServerAdapter):
 
     def run(self, handler):
         def wsgi_app(env, start):
+            # Log level and any extra text for the access log line.  Handlers
+            # can change them via request['stagehand.log'].
+            env['stagehand.log'] = {'level': logging.INFO, 'extra': None}
             return handler(env, start)
 
         f = self.loop.create_server(
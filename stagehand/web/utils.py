@@ -1,4 +1,5 @@
 import os
+import binascii
 import hashlib
 import functools
 import logging
@@ -19,6 +20,21 @@ from ..utils import abspath_to_zippath, get_file_from_zip
 log = logging.getLogger('stagehand.web.app')
 
 
+def _root():
+    """
+    Returns the URL path prefix for the web root for the current request,
+    which is empty unless the request came through a reverse proxy.
+
+    This is needed on every page render (and every new session), so it's
+    kept in the request environ after the first call.
+    """
+    environ = web.request.environ
+    root = environ.get('stagehand.root')
+    if root is None:
+        root = environ['stagehand.root'] = config.web.proxied_root if 'X-Forwarded-Host' in web.request.headers else ''
+    return root
+
+
 class SessionPlugin:
     name = 'session'
     api = 2
@@ -27,8 +43,9 @@ class SessionPlugin:
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             if 'stagehand.session' not in web.request.cookies:
-                path = config.web.proxied_root if 'X-Forwarded-Host' in web.request.headers else '/'
-                id = hashlib.md5(os.urandom(32)).hexdigest()
+                path = _root() or '/'
+                # urandom() output is already uniformly random, no need to hash it.
+                id = binascii.hexlify(os.urandom(16)).decode('ascii')
                 web.request.cookies['stagehand.session'] = id
                 web.response.set_cookie('stagehand.session', id, path=path)
             return func(*args, **kwargs)
@@ -50,15 +67,45 @@ class CachePlugin:
         elif cache not in (True, None):
             raise ValueError('Invalid cache value')
 
-        def wrapper(*args, **kwargs):
-            if cache and cache is not True:
+        if cache is True:
+            # Leave it entirely up to the callback.
+            return callback
+
+        # Cacheable JSON responses (including those which the client must
+        # always revalidate) are serialized here and given an ETag, so the
+        # client can revalidate them with a conditional request.
+        def json_response(response):
+            body = json.dumps(response)
+            etag = '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest()
+            bottle.response.headers['ETag'] = etag
+            if bottle.request.get_header('If-None-Match') == etag:
+                bottle.response.status = 304
+                return ''
+            bottle.response.content_type = 'application/json'
+            return body
+
+        # The above is all fixed per route, so pick a wrapper that does only
+        # what's needed for this one.
+        if cache is None:
+            def wrapper(*args, **kwargs):
+                response = callback(*args, **kwargs)
+                if isinstance(response, dict):
+                    # Response is JSON, so unless cache was explicitly True in the decorator,
+                    # we prevent the client (IE, I'm looking at you) from using it without
+                    # revalidating.  It's still stored though, so an unchanged response
+                    # can be answered with a 304 via the ETag.
+                    bottle.response.headers['Cache-Control'] = 'private,max-age=0,no-cache'
+                    return json_response(response)
+                return response
+        elif 'no-store' not in cache:
+            def wrapper(*args, **kwargs):
                 bottle.response.headers['Cache-Control'] = cache
-            response = callback(*args, **kwargs)
-            if isinstance(response, dict) and not cache:
-                # Response is JSON, so unless cache was explicitly True in the decorator,
-                # we prevent the client (IE, I'm looking at you) from caching it.
-                bottle.response.headers['Cache-Control'] = 'max-age=0,no-cache,no-store'
-            return response
+                response = callback(*args, **kwargs)
+                return json_response(response) if isinstance(response, dict) else response
+        else:
+            def wrapper(*args, **kwargs):
+                bottle.response.headers['Cache-Control'] = cache
+                return callback(*args, **kwargs)
 
         return wrapper
 
@@ -118,7 +165,7 @@ class CSTemplate(bottle.SimpleTemplate):
                     cached, self.source = cscompile_with_cache(self.filename, cachedir, is_html=True)
                 except CSCompileError as e:
                     raise bottle.HTTPError(500, e.args[0], traceback=e.args[1])
-                bottle.response.logextra = '(CS %s)' % 'cached' if cached else 'compiled'
+                bottle.request['stagehand.log']['extra'] = '(CS %s)' % ('cached' if cached else 'compiled')
                 # Before super does eval(), set filename to .compiled form so any exceptions
                 # raised show proper lines.
                 self.filename += '.compiled'
@@ -135,13 +182,47 @@ class CSTemplate(bottle.SimpleTemplate):
         return super().subtemplate(subtpl, _stdout, *args, **kwargs)
 
 
+# Cache-Control for static files requested with a version fingerprint (see
+# static_url()).  The URL changes whenever the file does, so the client
+# never needs to revalidate.
+STATIC_IMMUTABLE = 'public, max-age=31556952, immutable'
+
+def static_url(filename):
+    """
+    Returns the URL path (relative to the web root) for the given file under
+    /static/, fingerprinted with the file's modification time.
+
+    Responses for fingerprinted URLs are served with STATIC_IMMUTABLE, so
+    clients can skip requesting them entirely until the file changes.  This
+    is mainly useful for CoffeeScript, which otherwise needs to be looked up
+    in (and possibly compiled into) the cache on each request.
+    """
+    root = os.path.join(web.request['stagehand.manager'].paths.data, 'web')
+    try:
+        if abspath_to_zippath(root):
+            # Everything in the zip bundle changes together, so just use the
+            # bundle itself.
+            mtime = os.path.getmtime(abspath_to_zippath.zippath)
+        else:
+            src = os.path.join(root, filename)
+            if not os.path.exists(src) and filename.endswith('.coffee'):
+                # Only the pre-compiled version is available.
+                src += '.compiled'
+            mtime = os.path.getmtime(src)
+    except OSError:
+        # Let the static route deal with it (probably with a 404).
+        return '/static/' + filename
+    return '/static/%s?v=%x' % (filename, int(mtime))
+
+
 def _render_cstemplate(fname, kwargs):
     # All templates get these special names exposed.
     kwargs.update({
         'manager': web.request['stagehand.manager'],
         'config': config,
         'json': json.dumps,
-        'root': config.web.proxied_root if 'X-Forwarded-Host' in web.request.headers else ''
+        'static_url': static_url,
+        'root': _root()
     })
     session = web.request.cookies['stagehand.session']
     if session: